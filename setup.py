@@ -33,6 +33,9 @@ setup(
     [console_scripts]
     flask-ctl = presence_analyzer.script:run
     fetch-xml = presence_analyzer.fetchxml:run
+    precompress-static = presence_analyzer.middleware:run
+    load-test = presence_analyzer.loadtest:run
+    memory-report = presence_analyzer.memory:run
 
     [paste.app_factory]
     main = presence_analyzer.script:make_app
@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
-from .main import app
-from . import views
+"""
+Presence analyzer. Application is defined in main and gets its views
+registered by importing views (see script.make_app).
+"""
@@ -1,22 +1,32 @@
 # -*- coding: utf-8 -*-
 """Script that download fresh xml with users' names and urls for avatars"""
 
+import os
 import urllib2
 
-from script import make_app
+from presence_analyzer.script import DEPLOY_CFG, load_config
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
 
 
-def run():
-    app = make_app()
-    with open(app.config['DATA_XML'], 'w') as xml_file:
-        try:
-            new_xml = urllib2.urlopen(app.config['REMOTE_XML']).read()
-        except URLError:
-            log.debug('Problem with fetching xml from remote location.')
-        except KeyError:
-            log.debug('REMOTE_XML not configured in configuration of app.')
-        else:
-            xml_file.write(new_xml)
+def run(config=DEPLOY_CFG):
+    """
+    Fetches xml and replaces DATA_XML with it at once, so readers never
+    see the file empty or partially written. DATA_XML is kept if fetching
+    fails.
+    """
+    app = load_config(config)
+    try:
+        new_xml = urllib2.urlopen(app.config['REMOTE_XML']).read()
+    except urllib2.URLError:
+        log.debug('Problem with fetching xml from remote location.')
+        return
+    except KeyError:
+        log.debug('REMOTE_XML not configured in configuration of app.')
+        return
+    path = app.config['DATA_XML']
+    temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary, 'w') as xml_file:
+        xml_file.write(new_xml)
+    os.rename(temporary, path)
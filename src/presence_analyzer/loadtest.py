@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Load generator replaying mix of API requests against the application.
+"""
+
+import json
+import math
+import random
+import urllib2
+import argparse
+from threading import Thread
+from timeit import default_timer
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+# URL template and its weight in generated traffic
+ENDPOINTS = (
+    ('/api/v1/users', 30),
+    ('/api/v1/presence_weekday/{user_id}', 20),
+    ('/api/v1/mean_time_weekday/{user_id}', 20),
+    ('/api/v1/presence_start_end/{user_id}', 20),
+    ('/api/v1/percentile_time_weekday/{user_id}', 5),
+    ('/api/v1/percentile_start_weekday/{user_id}', 5),
+)
+HEADERS = {'Accept-Encoding': 'gzip'}
+
+
+class WSGIClient(object):
+    """
+    Sends requests to WSGI application in the same process.
+    """
+
+    def __init__(self, app):
+        from werkzeug.test import Client
+        from werkzeug.wrappers import BaseResponse
+        self.client = Client(app, BaseResponse, use_cookies=False)
+
+    def get(self, url, headers=HEADERS):
+        """
+        Returns status code and body of response.
+        """
+        response = self.client.get(url, headers=headers)
+        return response.status_code, response.data
+
+
+class HTTPClient(object):
+    """
+    Sends requests to running server.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, url, headers=HEADERS):
+        """
+        Returns status code and body of response.
+        """
+        request = urllib2.Request(self.base_url + url, headers=headers)
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError as error:
+            return error.code, error.read()
+        return response.getcode(), response.read()
+
+
+def user_ids(client):
+    """
+    Returns ids of all users listed by the application.
+    """
+    status, body = client.get('/api/v1/users', headers={})
+    if status != 200:
+        raise ValueError('Users listing failed with status {0}'.format(status))
+    return [user['user_id'] for user in json.loads(body)]
+
+
+def make_urls(ids, count, seed=None, endpoints=ENDPOINTS):
+    """
+    Returns count URLs drawn from endpoints according to their weights,
+    with user ids drawn uniformly from ids.
+    """
+    generator = random.Random(seed)
+    total = sum(weight for _, weight in endpoints)
+    urls = []
+    for _ in xrange(count):
+        point = generator.uniform(0, total)
+        for template, weight in endpoints:
+            point -= weight
+            if point <= 0:
+                break
+        urls.append(template.format(user_id=generator.choice(ids)))
+    return urls
+
+
+def replay(client, urls, concurrency=1):
+    """
+    Sends requests for urls from concurrency threads.
+
+    Returns latencies of requests in seconds, number of failed requests
+    and total time in seconds.
+    """
+    latencies = []
+    errors = []
+
+    def worker(share):
+        """
+        Sends requests for share of urls.
+        """
+        failed = 0
+        for url in share:
+            started = default_timer()
+            try:
+                status, _ = client.get(url)
+            except Exception:  # pylint: disable-msg=W0703
+                log.debug('Request for %s failed', url, exc_info=True)
+                status = None
+            latencies.append(default_timer() - started)
+            if status != 200:
+                failed += 1
+        errors.append(failed)
+
+    threads = [Thread(target=worker, args=(urls[i::concurrency],))
+               for i in range(concurrency)]
+    started = default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors), default_timer() - started
+
+
+def percentile(values, percent):
+    """
+    Returns given percentile of sorted values (nearest rank).
+    """
+    if not values:
+        return 0
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def summary(latencies, errors, elapsed):
+    """
+    Returns throughput and latency percentiles (in milliseconds) of run.
+    """
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p90': percentile(latencies, 90) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': (latencies[-1] if latencies else 0) * 1000,
+    }
+
+
+# bin/load-test
+def run(argv=None):
+    """
+    Runs load test and prints its summary.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--url', help='base URL of running server, '
+                        'application is loaded in process if not given')
+    parser.add_argument('--config', help='configuration of application '
+                        'loaded in process (default: deploy.cfg)')
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.url:
+        client = HTTPClient(args.url)
+    else:
+        from presence_analyzer import script
+        client = WSGIClient(script.make_app(
+            config=args.config or script.DEPLOY_CFG))
+    urls = make_urls(user_ids(client), args.requests, args.seed)
+    result = summary(*replay(client, urls, args.concurrency))
+    print ('{requests} requests, {errors} errors in {seconds:.2f} s, '
+           '{rps:.1f} requests/s').format(**result)
+    print ('latency p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms, '
+           'max {max:.1f} ms').format(**result)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Memory accounting of loaded data and cached values.
+"""
+
+import sys
+import json
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # pylint: disable-msg=C0103
+
+try:
+    import resource
+except ImportError:
+    resource = None  # pylint: disable-msg=C0103
+
+from presence_analyzer import utils
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Returns size in bytes of object and all objects reachable from it
+    through containers and attributes, each counted once.
+
+    Memory mapped segments are counted without their mapped contents,
+    which live in pages shared by processes.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, (basestring, int, long, float)):
+            continue
+        if isinstance(item, dict):
+            for key, value in item.iteritems():
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        if hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+        for slot in getattr(type(item), '__slots__', ()):
+            if hasattr(item, slot):
+                stack.append(getattr(item, slot))
+    return size
+
+
+def data_report(data, top=20):
+    """
+    Returns total deep size of presence data, sizes of its structures
+    summed over all users and sizes of top biggest users.
+    """
+    seen = set()
+    structures = {}
+    users = []
+    for user_id, user in data.iteritems():
+        user_size = sys.getsizeof(user)
+        seen.add(id(user))
+        for key, value in user.iteritems():
+            size = deep_sizeof(key, seen) + deep_sizeof(value, seen)
+            structures[key] = structures.get(key, 0) + size
+            user_size += size
+        users.append((user_size, user_id))
+    total = sys.getsizeof(data) + sum(size for size, _ in users) + \
+        sum(deep_sizeof(user_id, seen) for user_id in data)
+    return {
+        'total': total,
+        'users_count': len(users),
+        'structures': structures,
+        'users': [{'user_id': user_id, 'size': size}
+                  for size, user_id in sorted(users, reverse=True)[:top]],
+    }
+
+
+def cache_report():
+    """
+    Returns deep size of each cached value, biggest first. Values shared
+    by several entries are counted in each of them.
+    """
+    entries = []
+    for key, entry in utils.memcached_data.items():
+        entries.append({
+            'function': key[0],
+            'args': key[1],
+            'kwargs': key[2],
+            'generation': entry['generation'],
+            'size': deep_sizeof(entry['value']),
+        })
+    return sorted(entries, key=lambda entry: entry['size'], reverse=True)
+
+
+def max_rss():
+    """
+    Returns peak resident set size of process in kilobytes (bytes on
+    OS X), or None if it is not available.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def trace_load(top=10):
+    """
+    Returns memory allocated by loading presence data again.
+
+    With tracemalloc, top allocating source lines are reported. Otherwise
+    (Python 2) deep sizes of structures of loaded data are reported.
+    Growth of peak resident set size of process is reported in both cases.
+    Data is loaded without quarantine file and its report is discarded,
+    so state of data in use is kept.
+    """
+    rss = max_rss()
+    if tracemalloc is None:
+        data = utils.load_data()[0]
+        result = data_report(data, top)
+        result['method'] = 'sizeof'
+    else:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            data = utils.load_data()[0]  # pylint: disable-msg=W0612
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+        result = {
+            'method': 'tracemalloc',
+            'lines': [{'location': str(stat.traceback),
+                       'size': stat.size_diff, 'count': stat.count_diff}
+                      for stat in after.compare_to(before, 'lineno')[:top]],
+        }
+    result['max_rss_growth'] = None if rss is None else max_rss() - rss
+    return result
+
+
+def report(top=20, trace=False):
+    """
+    Returns memory report of presence data, cached values and, if trace
+    is set, of allocations made by loading data again.
+    """
+    return {
+        'generation': utils.data_generation,
+        'data': data_report(utils.get_data(), top),
+        'cache': cache_report(),
+        'trace': trace_load(top) if trace else None,
+    }
+
+
+# bin/memory-report
+def run():
+    """
+    Loads data and prints its memory report.
+    """
+    from presence_analyzer.script import load_config
+    load_config()
+    print json.dumps(report(trace=True), indent=2)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+WSGI middleware compressing responses and serving precompressed static files.
+"""
+
+import os
+import zlib
+import mimetypes
+from collections import OrderedDict
+from threading import Lock
+from wsgiref.headers import Headers
+
+from werkzeug.http import parse_accept_header
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'text/',
+)
+PRECOMPRESSED_EXTENSIONS = ('.css', '.js', '.html', '.json', '.xml')
+FAR_FUTURE = 365 * 24 * 3600  # seconds
+
+
+def gzip_compressor(level):
+    """
+    Returns zlib compressor producing gzip stream.
+    """
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class CompressionMiddleware(object):
+    """
+    Compresses responses with gzip for clients which accept it.
+
+    Responses smaller than min_size bytes, already encoded ones and ones of
+    not compressible types are passed untouched. Compressed bodies of
+    responses with ETag are remembered, so they are compressed only once.
+    Files from static folder are served from their precompressed '.gz'
+    copies (see precompress_static) with far-future cache headers.
+    """
+
+    def __init__(self, app, min_size=500, level=6, cache_size=256,
+                 static_folder=None, static_url_path='/static'):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.cache_size = cache_size
+        self.static_folder = static_folder and os.path.abspath(static_folder)
+        self.static_url_path = static_url_path.rstrip('/') + '/'
+        self.cache = OrderedDict()
+        self.cache_lock = Lock()
+
+    def __call__(self, environ, start_response):
+        if not accepts_gzip(environ):
+            return self.app(environ, start_response)
+
+        static = self.serve_precompressed(environ, start_response)
+        if static is not None:
+            return static
+
+        if environ.get('REQUEST_METHOD') != 'GET':
+            # HEAD responses have headers of full body, but no body to
+            # compress or to remember
+            return self.app(environ, start_response)
+
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            """
+            Holds status and headers until it is known whether to compress.
+            """
+            response['status'] = status
+            response['headers'] = headers
+            response['exc_info'] = exc_info
+            return lambda data: None
+
+        app_iter = self.app(environ, capture)
+        status = response['status']
+        headers = Headers(response['headers'])
+        if not self.should_compress(status, headers):
+            start_response(status, response['headers'], response['exc_info'])
+            return app_iter
+
+        key = None
+        if status.startswith('200') and 'ETag' in headers:
+            key = (environ.get('PATH_INFO'), environ.get('QUERY_STRING'),
+                   headers['ETag'])
+        with self.cache_lock:
+            body = self.cache.get(key) if key is not None else None
+
+        del headers['Content-Length']
+        headers['Content-Encoding'] = 'gzip'
+        headers.add_header('Vary', 'Accept-Encoding')
+        if 'ETag' in headers and not headers['ETag'].startswith('W/'):
+            # compressed body is other representation of the same resource
+            headers['ETag'] = 'W/' + headers['ETag']
+        if body is not None:
+            close(app_iter)
+            headers['Content-Length'] = str(len(body))
+            start_response(status, headers.items(), response['exc_info'])
+            return [body]
+        if key is not None:
+            body = ''.join(self.compress(app_iter))
+            with self.cache_lock:
+                self.cache[key] = body
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            headers['Content-Length'] = str(len(body))
+            start_response(status, headers.items(), response['exc_info'])
+            return [body]
+        start_response(status, headers.items(), response['exc_info'])
+        return self.compress(app_iter)
+
+    def should_compress(self, status, headers):
+        """
+        Checks whether response of given status and headers is worth
+        compressing.
+        """
+        if not status.startswith('200') or 'Content-Encoding' in headers:
+            return False
+        content_type = headers.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def compress(self, app_iter):
+        """
+        Compresses response body chunk by chunk.
+        """
+        compressor = gzip_compressor(self.level)
+        try:
+            for chunk in app_iter:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            close(app_iter)
+
+    def serve_precompressed(self, environ, start_response):
+        """
+        Serves precompressed copy of requested static file if there is one
+        at least as fresh as the file itself. Returns None otherwise.
+        """
+        path = environ.get('PATH_INFO', '')
+        if self.static_folder is None or \
+           not path.startswith(self.static_url_path) or \
+           environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return None
+        filename = os.path.normpath(os.path.join(
+            self.static_folder, path[len(self.static_url_path):]))
+        if not filename.startswith(self.static_folder + os.sep):
+            return None
+        try:
+            if os.path.getmtime(filename + '.gz') < \
+               os.path.getmtime(filename):
+                return None
+            with open(filename + '.gz', 'rb') as gz_file:
+                body = gz_file.read()
+        except (IOError, OSError):
+            return None
+
+        content_type = mimetypes.guess_type(filename)[0]
+        start_response('200 OK', [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Content-Encoding', 'gzip'),
+            ('Content-Length', str(len(body))),
+            ('Cache-Control', 'public, max-age={0}'.format(FAR_FUTURE)),
+            ('Vary', 'Accept-Encoding'),
+        ])
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return [body]
+
+
+def accepts_gzip(environ):
+    """
+    Checks whether client accepts gzip encoding with non-zero quality.
+    """
+    accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+    return accept['gzip'] > 0
+
+
+def close(app_iter):
+    """
+    Closes response iterable as required by WSGI.
+    """
+    if hasattr(app_iter, 'close'):
+        app_iter.close()
+
+
+def precompress_static(folder, min_size=500, level=9):
+    """
+    Writes '.gz' copy next to every compressible file in folder which is
+    bigger than min_size bytes. Returns list of written files.
+    """
+    written = []
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            if not name.endswith(PRECOMPRESSED_EXTENSIONS):
+                continue
+            filename = os.path.join(dirpath, name)
+            with open(filename, 'rb') as source:
+                data = source.read()
+            if len(data) < min_size:
+                continue
+            compressor = gzip_compressor(level)
+            with open(filename + '.gz', 'wb') as target:
+                target.write(compressor.compress(data) + compressor.flush())
+            written.append(filename + '.gz')
+    return written
+
+
+# bin/precompress-static
+def run():
+    """
+    Precompresses static files of the application.
+    """
+    from presence_analyzer.main import app
+    for filename in precompress_static(app.static_folder):
+        print filename
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Occupancy analysis: how many people are present at given time of weekday.
+"""
+
+from presence_analyzer.utils import cache, get_data, seconds_since_midnight
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+DEFAULT_BUCKET = 15  # minutes
+MAX_BUCKET = 24 * 60  # minutes
+
+
+@cache()
+def get_occupancy(bucket=DEFAULT_BUCKET):
+    """
+    Builds occupancy histograms of all users grouped by weekday.
+
+    Day is split into buckets of given length in minutes. Every presence
+    entry marks its start and end in a difference array, so the whole data
+    set is swept once and each histogram is a running sum of its array.
+    Person is counted in a bucket if present in any part of it.
+
+    It creates structure like this:
+    occupancy = {
+        0: {
+            'days': 52,
+            'counts': [0, 0, ..., 120, 134, ..., 0],
+        },
+        ...
+    }
+    where 'days' is number of distinct dates with any presence and 'counts'
+    are total numbers of people present in each bucket over all those days.
+    """
+    size = bucket * 60
+    buckets = (SECONDS_PER_DAY + size - 1) // size
+    diffs = [[0] * (buckets + 1) for _ in range(7)]
+    dates = [set() for _ in range(7)]
+
+    for user in get_data().itervalues():
+        for date, times in user['times'].iteritems():
+            start = seconds_since_midnight(times['start'])
+            end = seconds_since_midnight(times['end'])
+            if end <= start:
+                continue
+            weekday = date.weekday()
+            dates[weekday].add(date)
+            diffs[weekday][start // size] += 1
+            diffs[weekday][(end - 1) // size + 1] -= 1
+
+    result = {}
+    for weekday in range(7):
+        counts = []
+        running = 0
+        for delta in diffs[weekday][:buckets]:
+            running += delta
+            counts.append(running)
+        result[weekday] = {'days': len(dates[weekday]), 'counts': counts}
+    return result
+
+
+def occupancy_slice(weekday, bucket=DEFAULT_BUCKET, start=0,
+                    end=SECONDS_PER_DAY):
+    """
+    Returns occupancy of weekday between start and end (in seconds since
+    midnight) as list of (label, mean, total) tuples, one for each bucket.
+    """
+    histogram = get_occupancy(bucket)[weekday]
+    size = bucket * 60
+    days = histogram['days']
+    first = start // size
+    last = (end + size - 1) // size
+    result = []
+    for i, total in enumerate(histogram['counts'][first:last], first):
+        label = '{0:02d}:{1:02d}'.format(i * size // 3600,
+                                         i * size % 3600 // 60)
+        mean = float(total) / days if days > 0 else 0
+        result.append((label, mean, total))
+    return result
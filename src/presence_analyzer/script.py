@@ -6,8 +6,8 @@ import os
 import sys
 from functools import partial
 
-import paste.script.command
-import werkzeug.script
+# Flask, paste and the application itself are imported by functions which
+# need them, so commands like 'flask-ctl status' start instantly.
 
 etc = partial(os.path.join, 'parts', 'etc')
 
@@ -25,14 +25,48 @@ abspath = partial(os.path.join, _buildout_path)
 del _buildout_path
 
 
-# bin/paster serve parts/etc/deploy.ini
-def make_app(global_conf={}, config=DEPLOY_CFG, debug=False):
-    from presence_analyzer import app
+def load_config(config=DEPLOY_CFG, debug=False):
+    """Application with configuration loaded, but no views nor data."""
+    from presence_analyzer.main import app
     app.config.from_pyfile(abspath(config))
     app.debug = debug
     return app
 
 
+def warm_up(app):
+    """Load data, build derived indexes and compile templates."""
+    from presence_analyzer import occupancy, stats, utils
+    utils.get_data()
+    utils.get_users()
+    occupancy.get_occupancy(occupancy.DEFAULT_BUCKET)
+    stats.get_histograms()
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+# bin/paster serve parts/etc/deploy.ini
+def make_app(global_conf={}, config=DEPLOY_CFG, debug=False):
+    from presence_analyzer import views, watcher  # views register routes
+    from presence_analyzer.middleware import CompressionMiddleware
+    app = load_config(config, debug)
+    if app.config.get('DATA_WATCH', True):
+        watcher.start(
+            [app.config['DATA_CSV'], app.config['DATA_XML']],
+            interval=app.config.get('DATA_WATCH_INTERVAL', 1.0),
+        )
+    if not isinstance(app.wsgi_app, CompressionMiddleware):
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=app.config.get('COMPRESS_MIN_SIZE', 500),
+            level=app.config.get('COMPRESS_LEVEL', 6),
+            static_folder=app.static_folder,
+            static_url_path=app.static_url_path,
+        )
+    if app.config.get('WARMUP', True):
+        warm_up(app)
+    return app
+
+
 # bin/paster serve parts/etc/debug.ini
 def make_debug(global_conf={}, **conf):
     from werkzeug.debug import DebuggedApplication
@@ -75,11 +109,13 @@ def _serve(action, debug=False, dry_run=False):
         ]
     sys.argv = argv[:2] + [abspath(config)] + argv[3:]
     # Run the 'paster' command
+    import paste.script.command
     paste.script.command.run()
 
 
 # bin/flask-ctl ...
 def run():
+    import werkzeug.script
     action_shell = werkzeug.script.make_shell(make_shell, make_shell.__doc__)
 
     # bin/flask-ctl serve [fg|start|stop|restart|status]
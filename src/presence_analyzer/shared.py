@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Presence times kept in memory mapped segments shared by worker processes.
+"""
+
+import os
+import glob
+import json
+import mmap
+import struct
+from collections import Mapping
+from datetime import date, time
+from hashlib import md5
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+# user_id, date ordinal, start and end in seconds since midnight
+RECORD = struct.Struct('<iiii')
+# signature of data paths, signature of their contents
+SEGMENT_PATTERN = 'presence-{0}-{1}.bin'
+REPORT_PATTERN = 'presence-{0}-{1}.json'
+
+
+def segment_path(folder, paths):
+    """
+    Returns path of segment for current contents of given data files.
+
+    Segment is named by paths of the files, so configurations sharing
+    the folder keep their segments apart, and by modification time, size
+    and inode of the files, so all processes find the same segment for
+    the same data.
+    """
+    names = md5()
+    contents = md5()
+    for path in paths:
+        info = os.stat(path)
+        names.update(repr(os.path.abspath(path)))
+        contents.update(repr((info.st_mtime, info.st_size, info.st_ino)))
+    return os.path.join(folder, SEGMENT_PATTERN.format(
+        names.hexdigest(), contents.hexdigest()))
+
+
+def seconds_to_time(seconds):
+    """
+    Converts seconds since midnight to datetime.time.
+    """
+    return time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def report_path(path):
+    """
+    Returns path of load report of segment at path.
+    """
+    return os.path.splitext(path)[0] + '.json'
+
+
+def publish(path, records, report=None):
+    """
+    Writes records of (user_id, date, start, end) sorted by user and date
+    to segment at path, with load report next to it, and removes segments
+    of previous data of the same data files.
+
+    Files are written to temporary files and renamed, report first, so
+    other processes never see them incomplete. Processes still attached
+    to removed segments keep them mapped until they reload.
+    """
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    temporary = '{0}.{1}.tmp'.format(report_path(path), os.getpid())
+    with open(temporary, 'wb') as report_file:
+        json.dump(report, report_file)
+    os.rename(temporary, report_path(path))
+    temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as segment:
+        for user_id, day, start, end in records:
+            segment.write(RECORD.pack(user_id, day.toordinal(), start, end))
+    os.rename(temporary, path)
+    keep = (path, report_path(path))
+    names = os.path.basename(path).split('-')[1]
+    for pattern in (SEGMENT_PATTERN, REPORT_PATTERN):
+        for old in glob.glob(os.path.join(folder, pattern.format(names, '*'))):
+            if old not in keep:
+                try:
+                    os.remove(old)
+                except OSError:
+                    log.debug('Cannot remove old %s', old, exc_info=True)
+
+
+def read_report(path):
+    """
+    Returns load report published with segment at path, or None.
+    """
+    try:
+        with open(report_path(path), 'rb') as report_file:
+            return json.load(report_file)
+    except (IOError, ValueError):
+        log.debug('Cannot read report of %s', path, exc_info=True)
+        return None
+
+
+def attach(path, data):
+    """
+    Maps segment at path read-only and replaces presence times of users
+    in data with views of the segment.
+    """
+    with open(path, 'rb') as segment:
+        if os.fstat(segment.fileno()).st_size == 0:
+            buf = ''
+        else:
+            buf = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+    count = len(buf) // RECORD.size
+    ranges = {}
+    for i in xrange(count):
+        user_id = struct.unpack_from('<i', buf, i * RECORD.size)[0]
+        low, _ = ranges.get(user_id, (i, i))
+        ranges[user_id] = (low, i + 1)
+    for user_id, user in data.iteritems():
+        low, high = ranges.get(user_id, (0, 0))
+        user['times'] = SharedTimes(buf, low, high)
+    return data
+
+
+class SharedTimes(Mapping):
+    """
+    Read-only mapping of dates to presence times of one user, backed by
+    records low to high of shared segment.
+
+    Behaves like {date: {'start': time, 'end': time}} dictionary, values
+    are created on access.
+    """
+
+    def __init__(self, buf, low, high):
+        self.buf = buf
+        self.low = low
+        self.high = high
+
+    def record(self, i):
+        """
+        Returns i-th record of segment.
+        """
+        return RECORD.unpack_from(self.buf, i * RECORD.size)
+
+    def find(self, day):
+        """
+        Returns number of record of given date or None.
+        """
+        if not isinstance(day, date):
+            return None
+        ordinal = day.toordinal()
+        low, high = self.low, self.high
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[1] < ordinal:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.high and self.record(low)[1] == ordinal:
+            return low
+        return None
+
+    def __getitem__(self, day):
+        i = self.find(day)
+        if i is None:
+            raise KeyError(day)
+        _, _, start, end = self.record(i)
+        return {'start': seconds_to_time(start), 'end': seconds_to_time(end)}
+
+    def __contains__(self, day):
+        return self.find(day) is not None
+
+    def __iter__(self):
+        for i in xrange(self.low, self.high):
+            yield date.fromordinal(self.record(i)[1])
+
+    def __len__(self):
+        return self.high - self.low
+
+    def iteritems(self):
+        for i in xrange(self.low, self.high):
+            _, ordinal, start, end = self.record(i)
+            yield date.fromordinal(ordinal), {
+                'start': seconds_to_time(start),
+                'end': seconds_to_time(end),
+            }
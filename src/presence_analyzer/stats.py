@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Distribution statistics of presence built once per data load.
+"""
+
+from collections import Counter
+
+from presence_analyzer.utils import (
+    cache,
+    get_data,
+    interval,
+    seconds_since_midnight,
+)
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+DEFAULT_WIDTH = 60  # seconds
+DEFAULT_PERCENTILES = (50, 90)
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram of values given in seconds.
+
+    Only non-empty buckets are stored, so histogram of values from one day
+    never holds more than 24 * 3600 / width counters. Histograms of the
+    same width can be merged, quantiles are accurate to the bucket width.
+    """
+
+    def __init__(self, width=DEFAULT_WIDTH):
+        self.width = width
+        self.counts = Counter()
+        self.total = 0
+
+    def add(self, value):
+        """
+        Adds value to the histogram.
+        """
+        self.counts[value // self.width] += 1
+        self.total += 1
+
+    def merge(self, other):
+        """
+        Adds all values of other histogram of the same width.
+        """
+        if other.width != self.width:
+            raise ValueError('Cannot merge histograms of different widths.')
+        self.counts.update(other.counts)
+        self.total += other.total
+        return self
+
+    def quantile(self, fraction):
+        """
+        Returns value below which given fraction of values lays.
+
+        Value is the middle of matching bucket. Returns zero for empty
+        histograms.
+        """
+        if self.total == 0:
+            return 0
+        rank = max(1, fraction * self.total)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                break
+        return bucket * self.width + self.width // 2
+
+    def percentile(self, percent):
+        """
+        Returns given percentile of values.
+        """
+        return self.quantile(percent / 100.0)
+
+
+@cache()
+def get_histograms(width=DEFAULT_WIDTH):
+    """
+    Builds histograms of presence time and start time of each user
+    grouped by weekday.
+
+    It creates structure like this:
+    histograms = {
+        'user_id': {
+            'presence': {0: Histogram, 1: Histogram, ..., 6: Histogram},
+            'start': {0: Histogram, 1: Histogram, ..., 6: Histogram},
+        }
+    }
+    """
+    result = {}
+    for user_id, user in get_data().iteritems():
+        presence = {i: Histogram(width) for i in range(7)}
+        start = {i: Histogram(width) for i in range(7)}
+        for date, times in user['times'].iteritems():
+            weekday = date.weekday()
+            presence[weekday].add(interval(times['start'], times['end']))
+            start[weekday].add(seconds_since_midnight(times['start']))
+        result[user_id] = {'presence': presence, 'start': start}
+    return result
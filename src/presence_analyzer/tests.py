@@ -3,13 +3,37 @@
 Presence analyzer unit tests.
 """
 import os.path
+import csv
+import gzip
 import json
 import datetime
 import calendar
 import numbers
+import shutil
+import sys
+import tempfile
 import unittest
+from cStringIO import StringIO
 
-from presence_analyzer import main, views, utils
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from presence_analyzer import (
+    fetchxml,
+    loadtest,
+    main,
+    memory,
+    middleware,
+    occupancy,
+    script,
+    shared,
+    stats,
+    trend,
+    utils,
+    validation,
+    views,
+    watcher,
+)
 
 
 TEST_DATA_CSV = os.path.join(
@@ -63,6 +87,53 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
             u'avatar': u'https://intranet.stxnext.pl:443/api/images/users/141'
         })
 
+    def test_api_users_cached(self):
+        """
+        Test users listing served compressed and with ETag.
+        """
+        resp = self.client.get('/api/v1/users',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_encoding, 'gzip')
+        self.assertIn('Accept-Encoding', resp.vary)
+        data = json.loads(gzip.GzipFile(fileobj=StringIO(resp.data)).read())
+        self.assertEqual(len(data), 2)
+        etag = resp.headers['ETag']
+        resp = self.client.get('/api/v1/users',
+                               headers={'If-None-Match': etag,
+                                        'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, '')
+        resp = self.client.get('/api/v1/users',
+                               headers={'If-None-Match': etag,
+                                        'Accept-Encoding': 'gzip;q=0'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(resp.content_encoding)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        self.assertEqual(len(json.loads(resp.data)), 2)
+        resp = self.client.get('/api/v1/users',
+                               headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_api_users_search(self):
+        """
+        Test users search and pagination.
+        """
+        resp = self.client.get('/api/v1/users?q=ik%2011')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['user_id'], 11)
+        self.assertEqual(resp.headers['X-Total-Count'], '1')
+        resp = self.client.get('/api/v1/users?q=UZYT&page=2&per_page=1')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(resp.headers['X-Total-Count'], '2')
+        resp = self.client.get('/api/v1/users?page=3&per_page=1')
+        self.assertListEqual(json.loads(resp.data), [])
+        resp = self.client.get('/api/v1/users?page=0')
+        self.assertListEqual(json.loads(resp.data), [])
+
     def test_api_mean_time(self):
         """
         Test mean times of user.
@@ -167,6 +238,125 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         self.assertEqual(len(data), 0)
         self.assertListEqual(data, [])
 
+    def test_api_percentiles(self):
+        """
+        Test percentiles of presence time and start time of user.
+        """
+        resp = self.client.get('/api/v1/percentile_time_weekday/11')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 7)
+        self.assertListEqual(data[0], ['Mon', 24150, 24150])
+        self.assertListEqual(data[2], ['Wed', 25350, 25350])
+        self.assertListEqual(data[3], ['Thu', 22950, 23010])
+        self.assertListEqual(data[6], ['Sun', 0, 0])
+        resp = self.client.get('/api/v1/percentile_start_weekday/11?p=0&p=100')
+        data = json.loads(resp.data)
+        self.assertListEqual(data[3], ['Thu', 34110, 37110])
+        for url in ('/api/v1/percentile_time_weekday/100',
+                    '/api/v1/percentile_start_weekday/11?p=101'):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertListEqual(json.loads(resp.data), [])
+
+    def test_api_memory(self):
+        """
+        Test memory report.
+        """
+        resp = self.client.get('/api/v1/admin/memory')
+        self.assertEqual(resp.status_code, 404)
+        main.app.config['ADMIN_ENDPOINTS'] = True
+        try:
+            resp = self.client.get('/api/v1/admin/memory?top=1&trace')
+        finally:
+            del main.app.config['ADMIN_ENDPOINTS']
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertItemsEqual(
+            data.keys(), ['generation', 'data', 'cache', 'trace'])
+        self.assertIsNotNone(data['trace'])
+        self.assertEqual(data['data']['users_count'], 2)
+        self.assertEqual(len(data['data']['users']), 1)
+        self.assertItemsEqual(data['data']['structures'].keys(),
+                              ['name', 'avatar', 'times'])
+        self.assertIn('get_data',
+                      [entry['function'] for entry in data['cache']])
+
+    def test_api_trend(self):
+        """
+        Test weekly and monthly trend of user.
+        """
+        resp = self.client.get('/api/v1/trend/11?window=2')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 3)
+        self.assertListEqual(data[0],
+                             ['Period', 'Presence (h)', 'Rolling mean (h)'])
+        self.assertEqual(data[1][0], '2013-09-02')
+        self.assertAlmostEqual(data[1][1], 22999 / 3600.0)
+        self.assertAlmostEqual(data[1][2], 22999 / 3600.0)
+        self.assertEqual(data[2][0], '2013-09-09')
+        self.assertAlmostEqual(data[2][1], 95403 / 3600.0)
+        self.assertAlmostEqual(data[2][2], 59201 / 3600.0)
+        resp = self.client.get('/api/v1/trend/11?period=month')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[1][0], '2013-09')
+        self.assertAlmostEqual(data[1][1], (22999 + 95403) / 3600.0)
+        for url in ('/api/v1/trend/100',
+                    '/api/v1/trend/11?period=year',
+                    '/api/v1/trend/11?window=0'):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertListEqual(json.loads(resp.data), [])
+        for window in range(1, 6):
+            self.client.get('/api/v1/trend/11?window={0}'.format(window))
+        functions = [key[0] for key in utils.memcached_data]
+        self.assertNotIn('get_trend', functions)
+        self.assertIn(('get_series', repr((11, 'week')), repr({})),
+                      utils.memcached_data)
+        self.assertEqual(functions.count('get_series'), 2)
+        entries = len(utils.memcached_data)
+        for user_id in range(100000, 100010):
+            resp = self.client.get('/api/v1/trend/{0}'.format(user_id))
+            self.assertListEqual(json.loads(resp.data), [])
+        self.assertEqual(len(utils.memcached_data), entries)
+
+    def test_api_occupancy(self):
+        """
+        Test occupancy of weekday.
+        """
+        resp = self.client.get('/api/v1/occupancy/1?start=09:00&end=10:30')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertListEqual(data, [
+            ['09:00', 0, 0],
+            ['09:15', 1, 1],
+            ['09:30', 2, 2],
+            ['09:45', 2, 2],
+            ['10:00', 2, 2],
+            ['10:15', 2, 2],
+        ])
+        resp = self.client.get('/api/v1/occupancy/1?bucket=60')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 24)
+        self.assertListEqual(data[13], ['13:00', 2, 2])
+        self.assertListEqual(data[14], ['14:00', 1, 1])
+        resp = self.client.get('/api/v1/occupancy/1?bucket=1')
+        self.assertTrue(resp.is_streamed)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 24 * 60)
+        self.assertListEqual(data[9 * 60 + 40], ['09:40', 2, 2])
+        for url in ('/api/v1/occupancy/7',
+                    '/api/v1/occupancy/1?bucket=0',
+                    '/api/v1/occupancy/1?start=9'):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertListEqual(json.loads(resp.data), [])
+
 
 class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
     """
@@ -231,6 +421,392 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         data = utils.seconds_since_midnight(sample_time)
         self.assertEqual(data, 86399)
 
+    def test_encode(self):
+        """
+        Test JSON encoding and streaming of lists in chunks.
+        """
+        data = [('Mon', 1.5), [None, 'b'], {'c': 1}]
+        self.assertEqual(json.loads(utils.encode(data)),
+                         [['Mon', 1.5], [None, 'b'], {'c': 1}])
+        self.assertRaises(ImportError, utils.find_encoder, ('missing',))
+        items = [('Mon', i) for i in range(10)]
+        chunks = list(utils.iter_encode(items, chunk=3))
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(json.loads(''.join(chunks)), json.loads(
+            utils.encode(items)))
+        self.assertEqual(''.join(utils.iter_encode([])), '[]')
+
+    def test_histogram(self):
+        """
+        Test fixed-bucket histogram.
+        """
+        histogram = stats.Histogram(10)
+        self.assertEqual(histogram.percentile(50), 0)
+        for value in range(100):
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(0), 5)
+        self.assertEqual(histogram.percentile(50), 45)
+        self.assertEqual(histogram.percentile(90), 85)
+        self.assertEqual(histogram.percentile(100), 95)
+        other = stats.Histogram(10)
+        for value in range(100, 200):
+            other.add(value)
+        histogram.merge(other)
+        self.assertEqual(histogram.total, 200)
+        self.assertEqual(histogram.percentile(50), 95)
+        self.assertRaises(ValueError, histogram.merge, stats.Histogram(20))
+
+    def test_warm_up(self):
+        """
+        Test loading of data and compiling of templates before serving.
+        """
+        utils.memcached_data = {}
+        main.app.jinja_env.cache.clear()
+        script.warm_up(main.app)
+        keys = set(utils.memcached_data)
+        self.assertSetEqual(keys, set([
+            ('get_data', '()', '{}'),
+            ('get_users', '()', '{}'),
+            ('get_occupancy', '(15,)', '{}'),
+            ('get_histograms', '()', '{}'),
+        ]))
+        self.assertEqual(len(main.app.jinja_env.cache), 5)
+        client = main.app.test_client()
+        for url in ('/api/v1/users',
+                    '/api/v1/occupancy/1',
+                    '/api/v1/percentile_time_weekday/10',
+                    '/api/v1/percentile_start_weekday/10'):
+            self.assertEqual(client.get(url).status_code, 200)
+        self.assertSetEqual(set(utils.memcached_data), keys)
+
+    def test_deep_sizeof(self):
+        """
+        Test deep size of objects.
+        """
+        text = 'x' * 1000
+        self.assertEqual(memory.deep_sizeof(text), sys.getsizeof(text))
+        self.assertGreater(memory.deep_sizeof([text]), 1000)
+        self.assertEqual(memory.deep_sizeof([text, text]),
+                         sys.getsizeof([text, text]) + sys.getsizeof(text))
+        self.assertGreater(memory.deep_sizeof({'a': [text]}), 1000)
+        histogram = stats.Histogram()
+        histogram.add(text.__len__())
+        self.assertGreater(memory.deep_sizeof(histogram),
+                           sys.getsizeof(histogram.counts))
+        data = utils.get_data()
+        report = memory.data_report(data)
+        self.assertEqual(report['total'], memory.deep_sizeof(data))
+        self.assertEqual(sum(report['structures'].values()),
+                         sum(user['size'] for user in report['users']) -
+                         sum(sys.getsizeof(user) for user in data.values()))
+
+    def test_trend(self):
+        """
+        Test grouping by period and rolling mean.
+        """
+        times = {
+            datetime.date(2013, 11, 29): {'start': datetime.time(9, 0, 0),
+                                          'end': datetime.time(10, 0, 0)},
+            datetime.date(2014, 2, 3): {'start': datetime.time(9, 0, 0),
+                                        'end': datetime.time(12, 0, 0)},
+        }
+        self.assertListEqual(trend.group_by_period(times, 'month'), [
+            (datetime.date(2013, 11, 1), 3600),
+            (datetime.date(2013, 12, 1), 0),
+            (datetime.date(2014, 1, 1), 0),
+            (datetime.date(2014, 2, 1), 10800),
+        ])
+        self.assertEqual(len(trend.group_by_period(times, 'week')), 11)
+        self.assertListEqual(trend.group_by_period({}, 'week'), [])
+        self.assertListEqual(trend.rolling_mean([4, 2, 0, 6, 1], 2),
+                             [4.0, 3.0, 1.0, 3.0, 3.5])
+        self.assertListEqual(trend.rolling_mean([4, 2, 0], 5),
+                             [4.0, 3.0, 2.0])
+
+    def test_get_occupancy(self):
+        """
+        Test occupancy histograms.
+        """
+        data = occupancy.get_occupancy(60)
+        self.assertItemsEqual(data.keys(), range(7))
+        for weekday in data:
+            self.assertEqual(len(data[weekday]['counts']), 24)
+        self.assertEqual(data[1]['days'], 1)
+        self.assertEqual(data[3]['days'], 2)
+        self.assertEqual(data[6]['days'], 0)
+        self.assertEqual(data[3]['counts'][9], 1)
+        self.assertEqual(data[3]['counts'][10], 3)
+        self.assertEqual(data[3]['counts'][15], 3)
+        self.assertEqual(data[3]['counts'][16], 2)
+        self.assertEqual(data[3]['counts'][17], 1)
+        self.assertEqual(sum(data[6]['counts']), 0)
+
+
+class PresenceAnalyzerValidationTestCase(unittest.TestCase):
+    """
+    Validation of CSV rows tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.folder = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.folder, 'data.csv')
+        self.quarantine_path = os.path.join(self.folder, 'quarantine.csv')
+        with open(TEST_DATA_CSV) as test_file:
+            rows = test_file.read()
+        with open(self.csv_path, 'w') as csv_file:
+            csv_file.write('user_id,date,start,end\n' + rows + '\n')
+            csv_file.write('\n'.join([
+                '10,2013-09-10,08:00:00,16:00:00',
+                '11,2013-09-30,17:00:00,08:00:00',
+                '12,2013-09-30,08:00:00,16:00:00',
+                'x,2013-09-30,08:00:00,16:00:00',
+                '10,2013-13-30,08:00:00,16:00:00',
+                '10,2013-09-30',
+                '',
+                '10,2013-09-30,8:00,16:00:00',
+                'Total: 16 rows',
+                '',
+            ]))
+        main.app.config.update({
+            'DATA_CSV': self.csv_path,
+            'DATA_XML': TEST_DATA_XML,
+            'DATA_QUARANTINE': self.quarantine_path,
+            'ADMIN_ENDPOINTS': True,
+        })
+        utils.bump_generation()
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        del main.app.config['DATA_QUARANTINE']
+        del main.app.config['ADMIN_ENDPOINTS']
+        utils.bump_generation()
+        shutil.rmtree(self.folder)
+
+    def test_api_load_report(self):
+        """
+        Test report of rejected rows.
+        """
+        resp = self.client.get('/api/v1/admin/load_report')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertDictEqual(data, {
+            'accepted': 9,
+            'unknown_users': 1,
+            'skipped': 3,
+            'rejected': 6,
+            'errors': {
+                'columns': 1,
+                'duplicate': 1,
+                'end_before_start': 1,
+                'user': 1,
+                'date': 1,
+                'time': 1,
+            },
+            'quarantine': self.quarantine_path,
+        })
+        self.assertEqual(
+            utils.get_data()[10]['times'][datetime.date(2013, 9, 10)]['start'],
+            datetime.time(9, 39, 5)
+        )
+        with open(self.quarantine_path) as quarantine_file:
+            rows = list(csv.reader(quarantine_file))
+        self.assertEqual(len(rows), 6)
+        self.assertListEqual(rows[4], ['16', 'columns', '10', '2013-09-30'])
+        self.assertListEqual(
+            rows[0], ['11', 'duplicate', '10', '2013-09-10', '08:00:00',
+                      '16:00:00'])
+
+    def test_trace_load(self):
+        """
+        Test tracing of loading data keeps state of data in use.
+        """
+        utils.get_data()
+        report = validation.last_report
+        os.remove(self.quarantine_path)
+        trace = memory.trace_load(top=1)
+        self.assertIs(validation.last_report, report)
+        self.assertFalse(os.path.exists(self.quarantine_path))
+        self.assertEqual(main.app.config['DATA_QUARANTINE'],
+                         self.quarantine_path)
+        data, load_report = utils.load_data()
+        self.assertIsNone(load_report['quarantine'])
+        self.assertEqual(load_report['accepted'], report['accepted'])
+        self.assertIs(validation.last_report, report)
+        self.assertIn(trace['method'], ('sizeof', 'tracemalloc'))
+        self.assertIn('max_rss_growth', trace)
+        if trace['method'] == 'sizeof':
+            self.assertEqual(trace['users_count'], 2)
+            self.assertItemsEqual(trace['structures'].keys(),
+                                  ['name', 'avatar', 'times'])
+
+    def test_validate_rows(self):
+        """
+        Test validation and rate-limited logging of rows.
+        """
+        quarantine = validation.Quarantine(log_limit=1)
+        rows = [['10', '2013-09-10', '09:00:00', '17:00:00']] + \
+            [['10', '2013-09-10', '09:00:00', '17:00:00']] * 3
+        users = {10: {'times': {}}}
+        valid = []
+        for user_id, day, start, end in validation.validate_rows(
+                rows, users, quarantine):
+            users[user_id]['times'][day] = {'start': start, 'end': end}
+            valid.append((user_id, day, start, end))
+        self.assertListEqual(valid, [(10, datetime.date(2013, 9, 10),
+                                      datetime.time(9), datetime.time(17))])
+        self.assertDictEqual(quarantine.report(), {
+            'accepted': 1,
+            'unknown_users': 0,
+            'skipped': 0,
+            'rejected': 3,
+            'errors': {'duplicate': 3},
+            'quarantine': None,
+        })
+        quarantine = validation.Quarantine()
+        rows = [['user_id', 'date', 'start', 'end'], [],
+                ['10', '2013-09-10', '09:00:00', '17:00:00'], [''],
+                ['Total: 1 row']]
+        users = {10: {'times': {}}}
+        self.assertEqual(len(list(validation.validate_rows(
+            rows, users, quarantine))), 1)
+        self.assertEqual(quarantine.skipped, 4)
+        self.assertEqual(sum(quarantine.counts.values()), 0)
+
+
+class PresenceAnalyzerMiddlewareTestCase(unittest.TestCase):
+    """
+    Compression middleware tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        self.static_folder = tempfile.mkdtemp()
+        shutil.copytree(
+            os.path.join(main.app.static_folder, 'js'),
+            os.path.join(self.static_folder, 'js')
+        )
+        self.middleware = middleware.CompressionMiddleware(
+            main.app.wsgi_app,
+            min_size=100,
+            static_folder=self.static_folder,
+        )
+        self.client = Client(self.middleware, BaseResponse)
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.static_folder)
+
+    def test_compression(self):
+        """
+        Test compression of responses above threshold.
+        """
+        url = '/api/v1/occupancy/1?bucket=60'
+        resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        data = json.loads(gzip.GzipFile(fileobj=StringIO(resp.data)).read())
+        self.assertEqual(len(data), 24)
+        resp = self.client.get(url)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(len(json.loads(resp.data)), 24)
+        resp = self.client.get('/api/v1/percentile_time_weekday/100',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.data, '[]')
+
+    def test_compression_cache(self):
+        """
+        Test caching of compressed responses with ETag.
+        """
+        resp = self.client.get('/static/js/basic.js',
+                               headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(self.middleware.cache), 1)
+        cached = resp.data
+        self.assertEqual(int(resp.headers['Content-Length']), len(cached))
+        resp = self.client.get('/static/js/basic.js',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.data, cached)
+        self.assertEqual(len(self.middleware.cache), 1)
+        resp = self.client.get('/api/v1/users',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(self.middleware.cache), 1)
+
+    def test_compression_head(self):
+        """
+        Test HEAD requests are neither compressed nor cached.
+        """
+        resp = self.client.head('/static/js/jquery.min.js',
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(len(self.middleware.cache), 0)
+        resp = self.client.get('/static/js/jquery.min.js',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        with open(os.path.join(main.app.static_folder, 'js',
+                               'jquery.min.js')) as js_file:
+            self.assertEqual(
+                gzip.GzipFile(fileobj=StringIO(resp.data)).read(),
+                js_file.read()
+            )
+
+    def test_compression_accept_encoding(self):
+        """
+        Test parsing of Accept-Encoding and weak ETag of compressed body.
+        """
+        url = '/static/js/basic.js'
+        etag = self.client.get(url).headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        for accept in ('gzip;q=0', 'deflate', 'identity, gzip;q=0.0'):
+            resp = self.client.get(url, headers={'Accept-Encoding': accept})
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.headers['ETag'], etag)
+        for accept in ('gzip;q=0.5', '*', 'deflate, GZIP'):
+            resp = self.client.get(url, headers={'Accept-Encoding': accept})
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(resp.headers['ETag'], 'W/' + etag)
+
+    def test_precompressed_static(self):
+        """
+        Test serving of precompressed static files.
+        """
+        written = middleware.precompress_static(self.static_folder)
+        self.assertItemsEqual(
+            [os.path.basename(filename) for filename in written],
+            ['jquery.min.js.gz']
+        )
+        resp = self.client.get('/static/js/jquery.min.js?v=1',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('max-age=31536000', resp.headers['Cache-Control'])
+        with open(os.path.join(main.app.static_folder, 'js',
+                               'jquery.min.js')) as js_file:
+            self.assertEqual(
+                gzip.GzipFile(fileobj=StringIO(resp.data)).read(),
+                js_file.read()
+            )
+        resp = self.client.get('/static/js/../../etc/passwd',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertNotEqual(resp.status_code, 200)
+
 
 def suite():
     """
@@ -239,6 +815,7 @@ def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(PresenceAnalyzerViewsTestCase))
     suite.addTest(unittest.makeSuite(PresenceAnalyzerUtilsTestCase))
+    suite.addTest(unittest.makeSuite(PresenceAnalyzerMiddlewareTestCase))
     return suite
 
 
@@ -250,6 +827,8 @@ class PresenceanalyzerCacheTestCase(unittest.TestCase):
         """
         Before each test, set up a environment.
         """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
         self.memcached_key = ('get_data', '()', '{}')
         utils.memcached_data = {}
         utils.get_data()
@@ -269,28 +848,265 @@ class PresenceanalyzerCacheTestCase(unittest.TestCase):
         self.assertEqual(utils.memcached_data.keys()[0], self.memcached_key)
         self.assertListEqual(
             sorted(utils.memcached_data[self.memcached_key].keys()),
-            ['exp_date', 'value']
+            ['exp_date', 'generation', 'value']
         )
+        self.assertIsNone(utils.memcached_data[self.memcached_key]['exp_date'])
 
     def test_recaching_get_data(self):
         """
-        Test re-caching of get_data().
+        Test re-caching of get_data() after data generation changes.
         """
-        then = datetime.datetime.now()-datetime.timedelta(seconds=600)
-        utils.memcached_data[self.memcached_key]['exp_date'] = then
-        utils.get_data()
-        self.assertNotEqual(
-            utils.memcached_data[self.memcached_key]['exp_date'],
-            then
+        data = utils.get_data()
+        self.assertIs(utils.get_data(), data)
+        utils.get_users()
+        self.assertEqual(len(utils.memcached_data), 2)
+
+        generation = utils.bump_generation()
+        self.assertEqual(len(utils.memcached_data), 0)
+        self.assertIsNot(utils.get_data(), data)
+        self.assertEqual(
+            utils.memcached_data[self.memcached_key]['generation'],
+            generation
         )
 
-        now = utils.memcached_data[self.memcached_key]['exp_date']
-        utils.get_data()
+    def test_recaching_with_ttl(self):
+        """
+        Test re-caching of values cached for limited time.
+        """
+        calls = []
+
+        @utils.cache(600)
+        def cached():
+            """
+            Counts calls.
+            """
+            calls.append(None)
+            return len(calls)
+
+        self.assertEqual(cached(), 1)
+        self.assertEqual(cached(), 1)
+        then = datetime.datetime.now()-datetime.timedelta(seconds=600)
+        utils.memcached_data[('cached', '()', '{}')]['exp_date'] = then
+        self.assertEqual(cached(), 2)
+        self.assertEqual(cached(), 2)
+
+
+class PresenceAnalyzerLoadTestCase(unittest.TestCase):
+    """
+    Load generator tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        self.client = loadtest.WSGIClient(main.app)
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        pass
+
+    def test_make_urls(self):
+        """
+        Test drawing of URLs according to weights of endpoints.
+        """
+        ids = loadtest.user_ids(self.client)
+        self.assertItemsEqual(ids, [10, 11])
+        endpoints = (('/a/{user_id}', 1), ('/b', 0), ('/c/{user_id}', 3))
+        urls = loadtest.make_urls(ids, 100, seed=1, endpoints=endpoints)
+        self.assertEqual(len(urls), 100)
         self.assertEqual(
-            utils.memcached_data[self.memcached_key]['exp_date'],
-            now
+            set(urls), set(['/a/10', '/a/11', '/c/10', '/c/11']))
+        self.assertGreater(len([url for url in urls if url[1] == 'c']), 50)
+        self.assertListEqual(
+            urls,
+            loadtest.make_urls(ids, 100, seed=1, endpoints=endpoints)
         )
 
+    def test_replay(self):
+        """
+        Test replaying requests and summary of results.
+        """
+        urls = loadtest.make_urls([10, 11], 50, seed=1)
+        latencies, errors, elapsed = loadtest.replay(
+            self.client, urls + ['/api/v1/missing'], concurrency=4)
+        self.assertEqual(len(latencies), 51)
+        self.assertEqual(errors, 1)
+        result = loadtest.summary(latencies, errors, elapsed)
+        self.assertEqual(result['requests'], 51)
+        self.assertGreater(result['rps'], 0)
+        self.assertLessEqual(result['p50'], result['p90'])
+        self.assertLessEqual(result['p99'], result['max'])
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4], 100), 4)
+        self.assertEqual(loadtest.percentile([], 90), 0)
+
+
+class PresenceAnalyzerSharedTestCase(unittest.TestCase):
+    """
+    Shared memory segment tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.folder = tempfile.mkdtemp()
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        utils.bump_generation()
+        self.expected = utils.get_data()
+        main.app.config.update({'DATA_SHM_DIR': self.folder})
+        utils.bump_generation()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        del main.app.config['DATA_SHM_DIR']
+        utils.bump_generation()
+        shutil.rmtree(self.folder)
+
+    def test_get_data_shared(self):
+        """
+        Test publishing of presence times and attaching to them.
+        """
+        data = utils.get_data()
+        report = validation.last_report
+        segments = sorted(os.listdir(self.folder))
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(report['accepted'], 9)
+        for user_id in self.expected:
+            times = data[user_id]['times']
+            self.assertIsInstance(times, shared.SharedTimes)
+            self.assertDictEqual(dict(times.items()),
+                                 self.expected[user_id]['times'])
+            self.assertDictEqual(dict(times.iteritems()),
+                                 self.expected[user_id]['times'])
+        sample_date = datetime.date(2013, 9, 10)
+        self.assertIn(sample_date, data[10]['times'])
+        self.assertNotIn(datetime.date(2013, 9, 9), data[10]['times'])
+        self.assertNotIn('2013-09-10', data[10]['times'])
+        self.assertEqual(data[10]['times'][sample_date]['start'],
+                         datetime.time(9, 39, 5))
+        self.assertRaises(KeyError, lambda: data[10]['times'][None])
+
+        utils.bump_generation()
+        validation.last_report = None
+        self.assertDictEqual(dict(utils.get_data()[11]['times']),
+                             self.expected[11]['times'])
+        self.assertListEqual(sorted(os.listdir(self.folder)), segments)
+        self.assertDictEqual(validation.last_report, report)
+
+    def test_publish(self):
+        """
+        Test replacing of segments of previous data of the same files only.
+        """
+        other = os.path.join(self.folder, 'presence-other-old.bin')
+        shared.publish(other, [], {'accepted': 2})
+        old = os.path.join(self.folder, 'presence-data-old.bin')
+        shared.publish(old, [], {'accepted': 0})
+        path = os.path.join(self.folder, 'presence-data-new.bin')
+        shared.publish(path, [(1, datetime.date(2013, 9, 9), 0, 86399)],
+                       {'accepted': 1})
+        self.assertListEqual(sorted(os.listdir(self.folder)), [
+            'presence-data-new.bin', 'presence-data-new.json',
+            'presence-other-old.bin', 'presence-other-old.json',
+        ])
+        names = [os.path.basename(shared.segment_path(
+            self.folder, [data_path])).split('-')[1]
+            for data_path in (TEST_DATA_CSV, TEST_DATA_XML, TEST_DATA_CSV)]
+        self.assertNotEqual(names[0], names[1])
+        self.assertEqual(names[0], names[2])
+        self.assertDictEqual(shared.read_report(path), {'accepted': 1})
+        self.assertIsNone(shared.read_report(old))
+        data = shared.attach(path, {1: {}, 2: {}})
+        self.assertEqual(data[1]['times'][datetime.date(2013, 9, 9)],
+                         {'start': datetime.time(0, 0, 0),
+                          'end': datetime.time(23, 59, 59)})
+        self.assertEqual(len(data[2]['times']), 0)
+        self.assertRaises(IOError, shared.attach, old, {})
+
+
+class PresenceAnalyzerWatcherTestCase(unittest.TestCase):
+    """
+    Data watcher tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, self.path)
+        self.watcher = watcher.DataWatcher([self.path, TEST_DATA_XML])
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.folder)
+
+    def test_check(self):
+        """
+        Test bumping data generation on change of watched files only.
+        """
+        generation = utils.data_generation
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(utils.data_generation, generation)
+        with open(self.path, 'a') as csv_file:
+            csv_file.write('10,2013-09-13,09:00:00,17:00:00\n')
+        self.assertTrue(self.watcher.check())
+        self.assertEqual(utils.data_generation, generation + 1)
+        self.assertFalse(self.watcher.check())
+        os.remove(self.path)
+        self.assertTrue(self.watcher.check())
+        self.assertEqual(utils.data_generation, generation + 2)
+
+    def test_poll(self):
+        """
+        Test watching files in background.
+        """
+        self.watcher.interval = 0.01
+        self.watcher.start()
+        self.watcher.stop()
+        self.watcher.join(1)
+        self.assertFalse(self.watcher.is_alive())
+
+    def test_fetch_xml(self):
+        """
+        Test replacing of xml file by fetched one only if fetching succeeds.
+        """
+        xml_path = os.path.join(self.folder, 'users.xml')
+        config = os.path.join(self.folder, 'fetch.cfg')
+        with open(xml_path, 'w') as xml_file:
+            xml_file.write('<old/>')
+        data_xml = main.app.config['DATA_XML']
+        try:
+            for remote in ('missing.xml', TEST_DATA_XML):
+                url = 'file://' + os.path.abspath(remote)
+                with open(config, 'w') as config_file:
+                    config_file.write('DATA_XML = {0!r}\n'
+                                      'REMOTE_XML = {1!r}\n'.format(
+                                          xml_path, url))
+                fetchxml.run(config)
+                with open(xml_path) as xml_file:
+                    if remote == TEST_DATA_XML:
+                        with open(TEST_DATA_XML) as expected:
+                            self.assertEqual(xml_file.read(), expected.read())
+                    else:
+                        self.assertEqual(xml_file.read(), '<old/>')
+        finally:
+            main.app.config['DATA_XML'] = data_xml
+            main.app.config.pop('REMOTE_XML', None)
+        self.assertItemsEqual(os.listdir(self.folder),
+                              ['data.csv', 'users.xml', 'fetch.cfg'])
+
 
 if __name__ == '__main__':
     unittest.main()
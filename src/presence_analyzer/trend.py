@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Weekly and monthly trends of presence of users.
+"""
+
+from collections import deque
+from datetime import timedelta
+
+from presence_analyzer.utils import cache, get_data, interval
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+DEFAULT_WINDOW = 4  # periods
+MAX_WINDOW = 120  # periods
+
+
+def week_start(date):
+    """
+    Returns Monday of week of given date.
+    """
+    return date - timedelta(days=date.weekday())
+
+
+def next_week(date):
+    """
+    Returns Monday of week following week starting at given date.
+    """
+    return date + timedelta(days=7)
+
+
+def month_start(date):
+    """
+    Returns first day of month of given date.
+    """
+    return date.replace(day=1)
+
+
+def next_month(date):
+    """
+    Returns first day of month following month starting at given date.
+    """
+    if date.month == 12:
+        return date.replace(year=date.year + 1, month=1, day=1)
+    return date.replace(month=date.month + 1, day=1)
+
+
+PERIODS = {
+    'week': (week_start, next_week, '%Y-%m-%d'),
+    'month': (month_start, next_month, '%Y-%m'),
+}
+
+
+def group_by_period(items, period):
+    """
+    Sums presence time of entries by period, including periods without
+    presence between the first and the last one.
+
+    Returns list of (period start, seconds) sorted by period.
+    """
+    start_of, next_of, _ = PERIODS[period]
+    totals = {}
+    for date, times in items.iteritems():
+        key = start_of(date)
+        totals[key] = totals.get(key, 0) + interval(times['start'],
+                                                    times['end'])
+    if not totals:
+        return []
+    result = []
+    current, last = min(totals), max(totals)
+    while current <= last:
+        result.append((current, totals.get(current, 0)))
+        current = next_of(current)
+    return result
+
+
+def rolling_mean(values, window):
+    """
+    Returns means of last window values (or fewer at the beginning) for
+    each of values, keeping running sum of the window.
+    """
+    result = []
+    last = deque()
+    total = 0
+    for value in values:
+        last.append(value)
+        total += value
+        if len(last) > window:
+            total -= last.popleft()
+        result.append(float(total) / len(last))
+    return result
+
+
+@cache()
+def get_series(user_id, period='week'):
+    """
+    Returns labels and presence hours of known user in each period, as list
+    of (label, hours) tuples.
+    """
+    label = PERIODS[period][2]
+    return [(start.strftime(label), seconds / 3600.0)
+            for start, seconds in group_by_period(
+                get_data()[user_id]['times'], period)]
+
+
+def get_trend(user_id, period='week', window=DEFAULT_WINDOW):
+    """
+    Returns presence hours of user in each period with rolling mean
+    of last window periods, as list of (label, hours, mean) tuples.
+
+    Only series of periods of known users is cached, rolling mean is
+    computed on each call, so cache does not grow with number of requested
+    windows nor with requests for unknown users.
+    """
+    if user_id not in get_data():
+        return []
+    series = get_series(user_id, period)
+    means = rolling_mean([hours for _, hours in series], window)
+    return [(label, hours, mean)
+            for (label, hours), mean in zip(series, means)]
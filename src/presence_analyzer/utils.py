@@ -4,38 +4,100 @@ Helper functions used in views.
 """
 
 import csv
+from cStringIO import StringIO
+from gzip import GzipFile
+from hashlib import md5
 from threading import Lock
 from datetime import datetime, timedelta
 from lxml import etree
-from json import dumps
 from functools import wraps
 from datetime import datetime
 
 from flask import Response
 
 from presence_analyzer.main import app
+from presence_analyzer import shared, validation
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
 
 
+JSON_LIBRARIES = ('ujson', 'simplejson', 'json')
+STREAM_THRESHOLD = 1000  # items
+STREAM_CHUNK = 500  # items
+
+
+def find_encoder(libraries=JSON_LIBRARIES):
+    """
+    Returns dumps function of the first JSON library which can be imported.
+    """
+    for library in libraries:
+        try:
+            return __import__(library).dumps
+        except ImportError:
+            continue
+    raise ImportError('None of {0} can be used.'.format(libraries))
+
+
+encode = find_encoder()  # pylint: disable-msg=C0103
+
+
+def iter_encode(items, chunk=STREAM_CHUNK):
+    """
+    Encodes list to JSON piece by piece, to be streamed in response.
+    """
+    yield '['
+    for i in xrange(0, len(items), chunk):
+        encoded = encode(items[i:i + chunk])[1:-1]
+        yield encoded if i == 0 else ',' + encoded
+    yield ']'
+
+
 def jsonify(function):
     """
     Creates a response with the JSON representation of wrapped function result.
+
+    Long lists are streamed instead of being encoded into one string,
+    responses are returned as they are.
     """
     @wraps(function)
     def inner(*args, **kwargs):
-        return Response(dumps(function(*args, **kwargs)),
-                        mimetype='application/json')
+        result = function(*args, **kwargs)
+        if isinstance(result, Response):
+            return result
+        elif isinstance(result, list) and len(result) > STREAM_THRESHOLD:
+            body = iter_encode(result)
+        else:
+            body = encode(result)
+        return Response(body, mimetype='application/json')
     return inner
 
 
 memcached_data = {}
+data_generation = 0  # pylint: disable-msg=C0103
+generation_lock = Lock()  # pylint: disable-msg=C0103
+
+
+def bump_generation():
+    """
+    Marks data files as changed, so all cached values have to be computed
+    again. Drops values cached for previous generations.
+    """
+    global data_generation
+    with generation_lock:
+        data_generation += 1
+        for key in memcached_data.keys():
+            entry = memcached_data.get(key)
+            if entry is not None and entry['generation'] != data_generation:
+                memcached_data.pop(key, None)
+        log.info('Data generation %d', data_generation)
+    return data_generation
 
 
-def cache(ttl=600):
+def cache(ttl=None):
     """
-    Cache values of callable in memory for given in seconds period of time.
+    Cache values of callable in memory until data generation changes
+    or, if ttl is given, for given in seconds period of time.
     """
     def cache_with_time(function):
         """
@@ -46,26 +108,43 @@ def cache(ttl=600):
 
         @wraps(function)
         def inner(*args, **kwargs):
-            global memcached_data
             memcached_key = (function.__name__, repr(args), repr(kwargs))
             with cache_lock:
-                if (not memcached_key in memcached_data or
-                   memcached_data[memcached_key]['exp_date'] < datetime.now()):
-                    memcached_data[memcached_key] = {
-                        'exp_date': datetime.now()+timedelta(seconds=ttl),
+                entry = memcached_data.get(memcached_key)
+                if (entry is None or
+                   entry['generation'] != data_generation or
+                   entry['exp_date'] is not None and
+                   entry['exp_date'] < datetime.now()):
+                    generation = data_generation
+                    entry = {
+                        'exp_date': (datetime.now()+timedelta(seconds=ttl)
+                                     if ttl is not None else None),
+                        'generation': generation,
                         'value': function(*args, **kwargs)
                     }
-            return memcached_data[memcached_key]['value']
+                    memcached_data[memcached_key] = entry
+            return entry['value']
 
         return inner
 
     return cache_with_time
 
 
-@cache(600)
+@cache()
 def get_data():
+    """
+    Returns presence data (see load_data), loaded once per data generation.
+    Its load report is kept in validation.last_report.
+    """
+    data, validation.last_report = load_data(
+        app.config.get('DATA_QUARANTINE'))
+    return data
+
+
+def load_data(quarantine_path=None):
     """
     Extracts presence data from CSV file and groups it by user_id.
+    Returns data and report of its validation.
 
     It creates structure like this:
     data = {
@@ -84,6 +163,14 @@ def get_data():
             }
         }
     }
+
+    Rows of CSV file are validated, rejected ones are counted in the report
+    and written to file at quarantine_path if it is given.
+
+    If DATA_SHM_DIR is configured, presence times are published to memory
+    mapped segment there, shared by all processes loading the same data,
+    and 'times' are read-only mappings backed by the segment. Processes
+    attaching to published segment read the report saved next to it.
     """
     data = {}
 
@@ -104,23 +191,90 @@ def get_data():
                 'times': {}
             }
 
-    with open(app.config['DATA_CSV'], 'r') as csvfile:
+    folder = app.config.get('DATA_SHM_DIR')
+    if folder:
+        path = shared.segment_path(
+            folder, [app.config['DATA_CSV'], app.config['DATA_XML']])
+        try:
+            shared.attach(path, data)
+            return data, shared.read_report(path)
+        except IOError:
+            log.debug('Segment %s is not published yet.', path)
+
+    quarantine = validation.Quarantine(quarantine_path)
+    with open(app.config['DATA_CSV'], 'r') as csvfile, quarantine:
         presence_reader = csv.reader(csvfile, delimiter=',')
-        for i, row in enumerate(presence_reader):
-            if len(row) != 4:
-                # ignore header and footer lines
-                continue
-            try:
-                user_id = int(row[0])
-                if user_id in data:
-                    date = datetime.strptime(row[1], '%Y-%m-%d').date()
-                    start = datetime.strptime(row[2], '%H:%M:%S').time()
-                    end = datetime.strptime(row[3], '%H:%M:%S').time()
-                    data[user_id]['times'][date] = {'start': start, 'end': end}
-            except (ValueError, TypeError):
-                log.debug('Problem with line %d: ', i, exc_info=True)
+        for user_id, date, start, end in validation.validate_rows(
+                presence_reader, data, quarantine):
+            data[user_id]['times'][date] = {'start': start, 'end': end}
+    report = quarantine.report()
 
-    return data
+    if folder:
+        shared.publish(path, (
+            (user_id, date, seconds_since_midnight(times['start']),
+             seconds_since_midnight(times['end']))
+            for user_id in sorted(data)
+            for date, times in sorted(data[user_id]['times'].items())
+        ), report)
+        shared.attach(path, data)
+
+    return data, report
+
+
+@cache()
+def get_users():
+    """
+    Returns users listing for dropdown, prepared once per data load.
+
+    It creates structure like this:
+    users = {
+        'users': [{'user_id': 10, 'name': 'User 10', 'avatar': None}, ...],
+        'names': ['user 10', ...],
+        'identity': '[{"user_id": 10, ...}, ...]',
+        'gzip': '\x1f\x8b...',
+        'etag': 'd41d8cd98f00b204e9800998ecf8427e',
+        'gzip_etag': '9e107d9d372bb6826bd81d3542a419d6',
+    }
+    where 'names' are lowercased names for searching, 'identity' and 'gzip'
+    are ready to send bodies of response with the whole listing and 'etag',
+    'gzip_etag' are their own validators.
+    """
+    data = get_data()
+    users = []
+    for i in data.keys():
+        if 'name' in data[i]:
+            users.append({
+                'user_id': i,
+                'name': data[i]['name'],
+                'avatar': data[i]['avatar']
+            })
+        else:
+            users.append({
+                'user_id': i,
+                'name': 'User {0}'.format(str(i)),
+                'avatar': None
+            })
+
+    identity = encode(users)
+    compressed = gzip_compress(identity)
+    return {
+        'users': users,
+        'names': [user['name'].lower() for user in users],
+        'identity': identity,
+        'gzip': compressed,
+        'etag': md5(identity).hexdigest(),
+        'gzip_etag': md5(compressed).hexdigest(),
+    }
+
+
+def gzip_compress(body, level=6):
+    """
+    Compresses body with gzip. Output depends only on body and level.
+    """
+    buf = StringIO()
+    with GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0) as gz:
+        gz.write(body)
+    return buf.getvalue()
 
 
 def group_by_weekday(items):
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Validation of presence rows read from CSV file.
+"""
+
+import csv
+from collections import Counter
+from datetime import date, time
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+LOG_LIMIT = 10  # logged rejections of each error type
+
+last_report = None  # pylint: disable-msg=C0103
+
+
+class Quarantine(object):
+    """
+    Collects rows rejected by validation.
+
+    Rejections are counted by error type, only first log_limit of each type
+    are logged and, if path is given, all of them are written to CSV file
+    there with line number and error type in front of original columns.
+    """
+
+    def __init__(self, path=None, log_limit=LOG_LIMIT):
+        self.path = path
+        self.log_limit = log_limit
+        self.counts = Counter()
+        self.accepted = 0
+        self.unknown_users = 0
+        self.skipped = 0
+        self.quarantine_file = None
+        self.writer = None
+
+    def __enter__(self):
+        if self.path:
+            self.quarantine_file = open(self.path, 'wb')
+            self.writer = csv.writer(self.quarantine_file)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.quarantine_file is not None:
+            self.quarantine_file.close()
+        if self.counts:
+            log.info('Rejected rows: %s', ', '.join(
+                '{0} {1}'.format(count, error)
+                for error, count in sorted(self.counts.items())))
+
+    def reject(self, line, row, error):
+        """
+        Counts, logs and quarantines row rejected because of error.
+        """
+        self.counts[error] += 1
+        if self.counts[error] <= self.log_limit:
+            log.debug('Line %d rejected (%s): %r', line, error, row)
+        elif self.counts[error] == self.log_limit + 1:
+            log.debug('Further rows rejected (%s) are not logged', error)
+        if self.writer is not None:
+            self.writer.writerow([line, error] + row)
+
+    def report(self):
+        """
+        Returns numbers of accepted rows, rows of unknown users, skipped
+        blank, header and footer rows and rejected rows by error type.
+        """
+        return {
+            'accepted': self.accepted,
+            'unknown_users': self.unknown_users,
+            'skipped': self.skipped,
+            'rejected': sum(self.counts.values()),
+            'errors': dict(self.counts),
+            'quarantine': self.path,
+        }
+
+
+def parse_date(value):
+    """
+    Parses date in YYYY-MM-DD format.
+    """
+    year, month, day = value.split('-')
+    return date(int(year), int(month), int(day))
+
+
+def parse_time(value):
+    """
+    Parses time in HH:MM:SS format.
+    """
+    hour, minute, second = value.split(':')
+    return time(int(hour), int(minute), int(second))
+
+
+def validate_rows(rows, users, quarantine):
+    """
+    Yields (user_id, date, start, end) of valid rows of users from users.
+
+    Rows with wrong number of columns or values which cannot be parsed,
+    rows which end before they start and rows of dates already present
+    in 'times' of the user are rejected to quarantine, so yielded rows
+    should be stored there before the next one is read. Rows of users
+    not in users are only counted.
+
+    Blank rows, the first row if it does not start with user id (header)
+    and rows with wrong number of columns after the last valid one
+    (footer) are only counted as skipped, so clean exports have no
+    rejections.
+    """
+    footer = []
+    header = True
+    for line, row in enumerate(rows, 1):
+        if not any(field.strip() for field in row):
+            quarantine.skipped += 1
+            continue
+        if header:
+            header = False
+            try:
+                int(row[0])
+            except ValueError:
+                quarantine.skipped += 1
+                continue
+        if len(row) != 4:
+            footer.append((line, row))
+            continue
+        for footer_line, footer_row in footer:
+            quarantine.reject(footer_line, footer_row, 'columns')
+        footer = []
+        try:
+            user_id = int(row[0])
+        except ValueError:
+            quarantine.reject(line, row, 'user')
+            continue
+        if user_id not in users:
+            quarantine.unknown_users += 1
+            continue
+        try:
+            day = parse_date(row[1])
+        except ValueError:
+            quarantine.reject(line, row, 'date')
+            continue
+        try:
+            start = parse_time(row[2])
+            end = parse_time(row[3])
+        except ValueError:
+            quarantine.reject(line, row, 'time')
+            continue
+        if end < start:
+            quarantine.reject(line, row, 'end_before_start')
+            continue
+        if day in users[user_id]['times']:
+            quarantine.reject(line, row, 'duplicate')
+            continue
+        quarantine.accepted += 1
+        yield user_id, day, start, end
+    quarantine.skipped += len(footer)
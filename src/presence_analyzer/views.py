@@ -3,17 +3,50 @@
 Defines views.
 """
 
+import os.path
 import calendar
-from flask import redirect, render_template, url_for, abort
+from datetime import datetime
+from flask import (
+    Response,
+    abort,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from jinja2 import TemplateNotFound
 
 from presence_analyzer.main import app
-from presence_analyzer import utils
+from presence_analyzer import (
+    memory,
+    occupancy,
+    stats,
+    trend,
+    utils,
+    validation,
+)
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
 
 
+USERS_PER_PAGE = 50
+
+
+@app.url_defaults
+def static_version(endpoint, values):
+    """
+    Adds modification time of static files to their URLs, so browsers can
+    cache them for long.
+    """
+    if endpoint == 'static' and 'filename' in values:
+        try:
+            values['v'] = int(os.path.getmtime(
+                os.path.join(app.static_folder, values['filename'])))
+        except OSError:
+            pass
+
+
 @app.route('/')
 @app.route('/<view>')
 def ui_view(view=None):
@@ -22,7 +55,8 @@ def ui_view(view=None):
     """
     titles = {'presence_weekday': 'Presence by weekday',
               'mean_time_weekday': 'Presence mean time by weekday',
-              'presence_start_end': 'Presence start-end weekday'}
+              'presence_start_end': 'Presence start-end weekday',
+              'presence_trend': 'Presence trend'}
     if view is None:
         return redirect(url_for('ui_view', view='presence_weekday'))
     else:
@@ -37,23 +71,39 @@ def ui_view(view=None):
 def users_view():
     """
     Users listing for dropdown.
+
+    Accepts optional 'q' argument to search by name and 'page', 'per_page'
+    arguments for pagination. Total number of matching users is returned
+    in X-Total-Count header.
     """
-    data = utils.get_data()
-    response = []
-    for i in data.keys():
-        if 'name' in data[i]:
-            response.append({
-                'user_id': i,
-                'name': data[i]['name'],
-                'avatar': data[i]['avatar']
-            })
+    users = utils.get_users()
+    query = request.args.get('q', '').lower()
+    page = request.args.get('page', type=int)
+    if not query and page is None:
+        if request.accept_encodings['gzip'] > 0:
+            response = Response(users['gzip'], mimetype='application/json')
+            response.content_encoding = 'gzip'
+            response.set_etag(users['gzip_etag'])
         else:
-            response.append({
-                'user_id': i,
-                'name': 'User {0}'.format(str(i)),
-                'avatar': None
-            })
+            response = Response(users['identity'],
+                                mimetype='application/json')
+            response.set_etag(users['etag'])
+        response.vary.add('Accept-Encoding')
+        response.headers['X-Total-Count'] = len(users['users'])
+        return response.make_conditional(request)
+
+    result = [user for user, name in zip(users['users'], users['names'])
+              if query in name]
+    total = len(result)
+    if page is not None:
+        per_page = request.args.get('per_page', USERS_PER_PAGE, type=int)
+        if page < 1 or per_page < 1:
+            log.debug('Wrong page %s or per_page %s!', page, per_page)
+            return []
+        result = result[(page - 1) * per_page:page * per_page]
 
+    response = Response(utils.encode(result), mimetype='application/json')
+    response.headers['X-Total-Count'] = total
     return response
 
 
@@ -76,6 +126,52 @@ def mean_time_weekday_view(user_id=None):
     return result
 
 
+def weekday_percentiles(user_id, which):
+    """
+    Returns percentiles given in 'p' arguments of histograms of given user
+    grouped by weekday.
+    """
+    histograms = stats.get_histograms()
+    if user_id not in histograms:
+        log.debug('User %s not found!', user_id)
+        return []
+
+    percents = request.args.getlist('p', type=int)
+    percents = percents or stats.DEFAULT_PERCENTILES
+    if not all(0 <= percent <= 100 for percent in percents):
+        log.debug('Wrong percentiles %s!', percents)
+        return []
+
+    weekdays = histograms[user_id][which]
+    return [
+        [calendar.day_abbr[weekday]] +
+        [histogram.percentile(percent) for percent in percents]
+        for weekday, histogram in weekdays.items()
+    ]
+
+
+@app.route('/api/v1/percentile_time_weekday/', methods=['GET'])
+@app.route('/api/v1/percentile_time_weekday/<int:user_id>', methods=['GET'])
+@utils.jsonify
+def percentile_time_weekday_view(user_id=None):
+    """
+    Returns percentiles (median and 90th by default) of presence time
+    of given user grouped by weekday.
+    """
+    return weekday_percentiles(user_id, 'presence')
+
+
+@app.route('/api/v1/percentile_start_weekday/', methods=['GET'])
+@app.route('/api/v1/percentile_start_weekday/<int:user_id>', methods=['GET'])
+@utils.jsonify
+def percentile_start_weekday_view(user_id=None):
+    """
+    Returns percentiles (median and 90th by default) of presence start time
+    of given user grouped by weekday.
+    """
+    return weekday_percentiles(user_id, 'start')
+
+
 @app.route('/api/v1/presence_weekday/', methods=['GET'])
 @app.route('/api/v1/presence_weekday/<int:user_id>', methods=['GET'])
 @utils.jsonify
@@ -115,3 +211,86 @@ def presence_start_end_view(user_id=None):
                utils.mean(ends[weekday]))
               for weekday in starts if len(starts[weekday]) > 0]
     return result
+
+
+@app.route('/api/v1/trend/', methods=['GET'])
+@app.route('/api/v1/trend/<int:user_id>', methods=['GET'])
+@utils.jsonify
+def trend_view(user_id=None):
+    """
+    Returns presence hours of given user in each week (or month) with their
+    rolling mean.
+
+    Accepts optional 'period' (week or month) and 'window' (number of
+    periods of rolling mean) arguments.
+    """
+    period = request.args.get('period', 'week')
+    window = request.args.get('window', trend.DEFAULT_WINDOW, type=int)
+    if period not in trend.PERIODS or not 0 < window <= trend.MAX_WINDOW:
+        log.debug('Wrong period %s or window %s!', period, window)
+        return []
+
+    result = trend.get_trend(user_id, period, window)
+    if not result:
+        log.debug('User %s not found!', user_id)
+        return []
+
+    return [('Period', 'Presence (h)', 'Rolling mean (h)')] + result
+
+
+@app.route('/api/v1/occupancy/<int:weekday>', methods=['GET'])
+@utils.jsonify
+def occupancy_view(weekday):
+    """
+    Returns mean number of people present in each time bucket of weekday.
+
+    Accepts optional 'bucket' (minutes) and 'start', 'end' (HH:MM) arguments.
+    """
+    bucket = request.args.get('bucket', occupancy.DEFAULT_BUCKET, type=int)
+    if not 0 <= weekday < 7 or not 0 < bucket <= occupancy.MAX_BUCKET:
+        log.debug('Wrong weekday %s or bucket %s!', weekday, bucket)
+        return []
+
+    try:
+        start = utils.seconds_since_midnight(datetime.strptime(
+            request.args.get('start', '00:00'), '%H:%M').time())
+        end = occupancy.SECONDS_PER_DAY
+        if 'end' in request.args:
+            end = utils.seconds_since_midnight(datetime.strptime(
+                request.args['end'], '%H:%M').time())
+    except ValueError:
+        log.debug('Wrong time range %s!', request.args)
+        return []
+
+    return occupancy.occupancy_slice(weekday, bucket, start, end)
+
+
+@app.route('/api/v1/admin/memory', methods=['GET'])
+@utils.jsonify
+def memory_view():
+    """
+    Returns memory report of loaded data and cached values. Available only
+    if ADMIN_ENDPOINTS are enabled.
+
+    Accepts optional 'top' argument (number of biggest users listed) and
+    'trace' argument to trace allocations of loading data again.
+    """
+    if not app.config.get('ADMIN_ENDPOINTS'):
+        abort(404)
+    return memory.report(
+        top=request.args.get('top', 20, type=int),
+        trace='trace' in request.args,
+    )
+
+
+@app.route('/api/v1/admin/load_report', methods=['GET'])
+@utils.jsonify
+def load_report_view():
+    """
+    Returns numbers of accepted and rejected rows of the last load of CSV
+    file. Available only if ADMIN_ENDPOINTS are enabled.
+    """
+    if not app.config.get('ADMIN_ENDPOINTS'):
+        abort(404)
+    utils.get_data()
+    return validation.last_report
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Watcher of data files bumping data generation when they change.
+"""
+
+import os
+from threading import Event, Thread
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None  # pylint: disable-msg=C0103
+
+from presence_analyzer import utils
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable-msg=C0103
+
+
+class DataWatcher(Thread):
+    """
+    Background thread watching data files.
+
+    Uses inotify when pyinotify is installed and polls files with stat
+    otherwise. Data generation is bumped only when modification time, size
+    or inode of any file really changes.
+    """
+
+    def __init__(self, paths, interval=1.0):
+        super(DataWatcher, self).__init__(name='DataWatcher')
+        self.daemon = True
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.interval = interval
+        self.stopped = Event()
+        self.stamps = self.stat()
+
+    def stat(self):
+        """
+        Returns modification time, size and inode of each watched file.
+        """
+        stamps = []
+        for path in self.paths:
+            try:
+                info = os.stat(path)
+            except OSError:
+                stamps.append(None)
+            else:
+                stamps.append((info.st_mtime, info.st_size, info.st_ino))
+        return stamps
+
+    def check(self):
+        """
+        Bumps data generation if any of watched files has changed.
+        """
+        stamps = self.stat()
+        if stamps == self.stamps:
+            return False
+        self.stamps = stamps
+        log.info('Data files changed: %s', ', '.join(self.paths))
+        utils.bump_generation()
+        return True
+
+    def stop(self):
+        """
+        Stops watching at next check.
+        """
+        self.stopped.set()
+
+    def run(self):
+        if pyinotify is not None:
+            self.notify()
+        else:
+            self.poll()
+
+    def poll(self):
+        """
+        Checks files with stat every interval seconds.
+        """
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def notify(self):
+        """
+        Checks files whenever inotify reports changes in their directories.
+        """
+        manager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(
+            manager, lambda event: self.check()
+            if event.pathname in self.paths else None
+        )
+        mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_DELETE)
+        manager.add_watch(list(set(os.path.dirname(path)
+                                   for path in self.paths)), mask)
+        try:
+            while not self.stopped.is_set():
+                if notifier.check_events(int(self.interval * 1000)):
+                    notifier.read_events()
+                    notifier.process_events()
+        finally:
+            notifier.stop()
+
+
+watcher = None  # pylint: disable-msg=C0103
+
+
+def start(paths, interval=1.0):
+    """
+    Starts watching given files, replacing watcher of other files.
+    """
+    global watcher
+    paths = [os.path.abspath(path) for path in paths]
+    if watcher is not None and watcher.is_alive():
+        if watcher.paths == paths:
+            return watcher
+        watcher.stop()
+    watcher = DataWatcher(paths, interval)
+    watcher.start()
+    return watcher